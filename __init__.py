@@ -30,12 +30,19 @@ Things to do
 ------------
 # Move SG() class from __init__.py in here.
 """
+import asyncio
+import bisect
+import functools
+import itertools
 import logging
-from time import sleep
+import queue
+import struct
+import threading
+from multiprocessing import Process, Queue
+from time import monotonic, sleep
 from MonitorControl import ClassInstance, ObservatoryError
 from Electronics.Instruments import Synthesizer
 import valon_synth as vs
-from Data_Reduction import nearest_index
 
 module_logger = logging.getLogger(__name__)
 
@@ -45,12 +52,140 @@ synth = {}
 synth[1] = vs.SYNTH_A
 synth[2] = vs.SYNTH_B
 
+# Read commands of the Valon 5007 serial protocol.  Except for the reference
+# query, whose reply covers both synthesizers, the command byte is OR'ed with
+# the synthesizer selector, as valon_synth does.  Every reply is followed by a
+# checksum byte.
+REG_READ   = 0x80 # 24 bytes: the six PLL registers
+REF_READ   = 0x81 #  4 bytes: reference frequency in Hz
+LABEL_READ = 0x82 # 16 bytes: label
+VCO_READ   = 0x83 #  4 bytes: VCO range minimum and maximum in MHz
+LOCK_READ  = 0x86 #  1 byte:  phase lock bits
+reply_len = {REG_READ: 24, REF_READ: 4, LABEL_READ: 16, VCO_READ: 4,
+             LOCK_READ: 1}
+
+def read_command(code, s):
+  """
+  Command byte for reading 'code' from synthesizer 's'
+  """
+  return code if code == REF_READ else code | s
+
+def nearest_in_sorted(keys, x):
+  """
+  Element of 'keys' nearest to 'x'
+
+  Ties go to the smaller element.
+
+  @param keys : values in ascending order
+  @type  keys : sequence
+
+  @param x : value to match
+  @type  x : float
+  """
+  idx = bisect.bisect_left(keys, x)
+  if idx == len(keys) or (idx > 0 and keys[idx]-x >= x-keys[idx-1]):
+    idx -= 1
+  return keys[idx]
+
+# How close a requested value must be to the remembered one to be taken as
+# unchanged.  Other parameters must match exactly.
+set_tolerance = {"frequency": 1e-6} # MHz
+# Parameters which are set from several arguments and read back as a tuple
+tuple_params = ("options", "VCO range")
+
+class _LazyDict(dict):
+  """
+  dict which is filled by calling 'loader' when it is first read
+
+  Keys which are already there, e.g. from a single parameter read, are
+  looked up without loading.
+
+  The load is done holding 'lock', so a thread reading the dict meanwhile
+  waits for it to finish.  The loader itself may read the dict.
+  """
+  def __init__(self, loader, lock):
+    dict.__init__(self)
+    self._loader = loader
+    self._lock = lock
+    self._loading = False
+
+  def _load(self):
+    with self._lock:
+      if self._loader is None or self._loading:
+        return
+      self._loading = True
+      try:
+        self._loader()
+        self._loader = None
+      finally:
+        self._loading = False
+
+  def __getitem__(self, key):
+    if self._loader and not dict.__contains__(self, key):
+      self._load()
+    return dict.__getitem__(self, key)
+
+  def get(self, key, default=None):
+    if self._loader and not dict.__contains__(self, key):
+      self._load()
+    return dict.get(self, key, default)
+
+  def __contains__(self, key):
+    if self._loader and not dict.__contains__(self, key):
+      self._load()
+    return dict.__contains__(self, key)
+
+  def __iter__(self):
+    if self._loader:
+      self._load()
+    return dict.__iter__(self)
+
+  def __len__(self):
+    if self._loader:
+      self._load()
+    return dict.__len__(self)
+
+  def keys(self):
+    if self._loader:
+      self._load()
+    return dict.keys(self)
+
+  def values(self):
+    if self._loader:
+      self._load()
+    return dict.values(self)
+
+  def items(self):
+    if self._loader:
+      self._load()
+    return dict.items(self)
+
+  def __repr__(self):
+    if self._loader:
+      self._load()
+    return dict.__repr__(self)
+
+  def __reduce__(self):
+    # pickled as a plain dict, without the loader and the lock
+    return dict, (dict(self.items()),)
+
+  def loaded(self):
+    """
+    Mark the dict as filled, so that reading it does not call 'loader'
+    """
+    self._loader = None
+
 class Valon5007(vs.Synthesizer):
   """
   Actual dual-output Valon synthesizer unit
 
   Queried parameters are remembered as instance parameters.
 
+  There is one object per serial port.  Instantiating the class again with
+  the same port returns the existing object, so that Valon1 and Valon2 share
+  the hardware.  The object's lock serializes the use of the port by their
+  threads.
+
   Notes
   =====
 
@@ -138,57 +273,283 @@ class Valon5007(vs.Synthesizer):
   https://github.com/nrao/ValonSynth/wiki
   http://www.altera.com/support/devices/pll_clock/basics/pll-basics.html
   """
-  def __init__(self, timeout=None):
+  # valon_synth.Synthesizer has no __slots__, so instances still have a
+  # __dict__ for its attributes; these are the ones used on every poll
+  __slots__ = ("conn", "__get_tasks__", "__set_tasks__", "__read_cmds__",
+               "__decoders__", "__settle_tasks__", "status", "options",
+               "vco_range", "name", "_get_plan", "_shown", "_rfl_keys",
+               "_cache_ts", "_ttl", "_settle_max", "_ready", "_lock")
+  _instances = {}
+  _instances_lock = threading.RLock()
+
+  def __new__(cls, timeout=None, port="/dev/ttyUSB0"):
+    """
+    Return the existing object for the port, if there is one
+    """
+    with cls._instances_lock:
+      if port not in cls._instances:
+        self = super(Valon5007, cls).__new__(cls)
+        self._ready = False
+        cls._instances[port] = self
+      return cls._instances[port]
+
+  def __init__(self, timeout=None, port="/dev/ttyUSB0"):
     """
     Initialize the Valon5007 object
+
+    If the object for this port is already initialized only a timeout
+    other than None is applied, replacing the one it had.
+
+    @param timeout : serial port timeout
+    @type  timeout : float
+
+    @param port : serial port device
+    @type  port : str
     """
-    module_logger.debug("Initializing Valon5007")
-    vs.Synthesizer.__init__(self,"/dev/ttyUSB0")
-    self.conn.setTimeout(timeout)
-    module_logger.debug("valon_synth.Synthesizer initialized")
-    # These are the minimum attributes of a Synthesizer
-    self.__get_tasks__ = {"frequency":  self.get_frequency,
-                          "rf_level":   self.get_rf_level,
-                          "phase lock": self.get_phase_lock}
-    self.__set_tasks__ = {"frequency":  self.set_frequency,
-                          "rf_level":   self.set_rf_level}
-    self.freq = {}
-    self.pwr = {}
-    self.lock = {}
-    # These are specific to the Valon5007
-    self.__get_tasks__["label"] =      self.get_label
-    self.__get_tasks__["VCO range"] =  self.get_vco_range
-    self.__get_tasks__["options"] =    self.get_options
-    self.__set_tasks__["label"] =      self.set_label
-    self.__set_tasks__["VCO range"] =  self.set_vco_range
-    self.__set_tasks__["options"] =    self.set_options
-    self.status = {1:{}, 2:{}}
-    self.options = {}
-    self.vco_range = {}
-    self.name = {}
-    # Initialize attributes
-    for synth_id in [1,2]:
-      self.update_synth_status(synth_id)
-    module_logger.debug("__init__(): done")
+    with Valon5007._instances_lock:
+      if self._ready:
+        if timeout is not None:
+          with self._lock:
+            self.conn.setTimeout(timeout)
+        return
+      module_logger.debug("Initializing Valon5007")
+      vs.Synthesizer.__init__(self,port)
+      self.conn.setTimeout(timeout)
+      module_logger.debug("valon_synth.Synthesizer initialized")
+      # valid RF levels, in ascending order
+      self._rfl_keys = tuple(sorted(self.rfl_rev_table.keys()))
+      # held around every use of the serial port, which is shared by all the
+      # users of this object
+      self._lock = threading.RLock()
+      # These are the minimum attributes of a Synthesizer
+      self.__get_tasks__ = {"frequency":  self.get_frequency,
+                            "rf_level":   self.get_rf_level,
+                            "phase lock": self.get_phase_lock}
+      self.__set_tasks__ = {"frequency":  self.set_frequency,
+                            "rf_level":   self.set_rf_level}
+      # These are specific to the Valon5007
+      self.__get_tasks__["label"] =      self.get_label
+      self.__get_tasks__["VCO range"] =  self.get_vco_range
+      self.__get_tasks__["options"] =    self.get_options
+      self.__set_tasks__["label"] =      self.set_label
+      self.__set_tasks__["VCO range"] =  self.set_vco_range
+      self.__set_tasks__["options"] =    self.set_options
+      self._shown = tuple(sorted(self.__get_tasks__))
+      # Wire commands whose replies give each parameter, and their decoders,
+      # for reading many parameters in one exchange
+      self.__read_cmds__ = {"frequency":  (REG_READ, REF_READ),
+                            "rf_level":   (REG_READ,),
+                            "phase lock": (LOCK_READ,),
+                            "label":      (LABEL_READ,),
+                            "VCO range":  (VCO_READ,),
+                            "options":    (REG_READ,)}
+      self.__decoders__ = {"frequency":  self._decode_frequency,
+                           "rf_level":   self._decode_rf_level,
+                           "phase lock": self._decode_phase_lock,
+                           "label":      self._decode_label,
+                           "VCO range":  self._decode_vco_range,
+                           "options":    self._decode_options}
+      # Parameters after whose setting the synthesizer must re-lock
+      self.__settle_tasks__ = {"frequency": self._wait_locked,
+                               "rf_level":  self._wait_locked,
+                               "VCO range": self._wait_locked,
+                               "options":   self._wait_locked}
+      # (param, read commands, decoder) for all the shown parameters, so the
+      # status update need not look them up
+      self._get_plan = tuple([(param, self.__read_cmds__[param],
+                               self.__decoders__[param])
+                              for param in self._shown])
+      # longest wait for phase lock after a set
+      self._settle_max = 0.1
+      # the status of a synthesizer is read when it is first needed
+      self.status = {1: _LazyDict(self.update_all_status, self._lock),
+                     2: _LazyDict(self.update_all_status, self._lock)}
+      self.options = {}
+      self.vco_range = {}
+      self.name = {}
+      # time of the last hardware read of each (synth_id, param); reads within
+      # self._ttl seconds of it are answered from self.status
+      self._cache_ts = {}
+      self._ttl = 0.5
+      self._ready = True
+      module_logger.debug("__init__(): done")
 
   def shown_parameters(self):
-    pars = self.__get_tasks__.keys()
-    pars.sort()
-    return pars
+    """
+    Names of the parameters reported in the status, in alphabetical order
+    """
+    return self._shown
     
   def update_synth_status(self,synth_id):
     """
     Update all the status data
 
+    Parameters read less than self._ttl seconds ago are not re-read.  The
+    others are read in one serial exchange.
+
     @param synth_id : 1 or 2
     @type  synth_id : int
 
-    @return:None
+    @return: status dict of the synthesizer
     """
-    module_logger.debug("Getting status for synth "+str(synth_id))
-    for param in self.__get_tasks__.keys():
-      self.get_p(param,synth_id)
+    module_logger.debug("Getting status for synth %d", synth_id)
+    self._batch_get({synth_id: self._stale(synth_id)})
+    self.status[synth_id].loaded()
     return self.status[synth_id]
+
+  def update_all_status(self):
+    """
+    Update the status data of both synthesizers
+
+    Parameters read less than self._ttl seconds ago are not re-read.  The
+    others, for both synthesizers, are read in one serial exchange.
+
+    @return: status dicts by synth_id
+    """
+    module_logger.debug("Getting status for all synths")
+    self._batch_get(dict([(synth_id, self._stale(synth_id))
+                          for synth_id in synth]))
+    for synth_id in synth:
+      self.status[synth_id].loaded()
+    return self.status
+
+  def _stale(self, synth_id):
+    """
+    Entries of self._get_plan for parameters not read within self._ttl
+    """
+    now = monotonic()
+    cache_ts = self._cache_ts
+    return [entry for entry in self._get_plan
+            if now - cache_ts.get((synth_id,entry[0]), float("-inf"))
+                                                               >= self._ttl]
+
+  def _batch_get(self, plans):
+    """
+    Read several parameters in one serial exchange
+
+    Each read command needed is sent once, so the PLL register block, from
+    which the frequency, RF level and options are all decoded, is read only
+    once per synthesizer, and the reference only once.
+
+    @param plans : entries of self._get_plan for the parameters to read
+    @type  plans : dict of lists keyed by synth_id
+    """
+    commands = []
+    for synth_id, plan in plans.items():
+      for param, cmds, decoder in plan:
+        for code in cmds:
+          command = read_command(code, synth[synth_id])
+          if command not in commands:
+            commands.append(command)
+    if not commands:
+      return
+    with self._lock:
+      replies = self._exchange(commands)
+      cache_ts = self._cache_ts
+      now = monotonic()
+      for synth_id, plan in plans.items():
+        s = synth[synth_id]
+        st = self.status[synth_id]
+        for param, cmds, decoder in plan:
+          st[param] = decoder(s, replies)
+          cache_ts[(synth_id,param)] = now
+
+  def _exchange(self, commands):
+    """
+    Send read commands and get their replies
+
+    The commands are written at once and then all the replies are read at
+    once, so the exchange costs one round trip instead of one per command.
+
+    @param commands : command bytes (see read_command())
+    @type  commands : list of int
+
+    @return: dict of replies by command, with the PLL registers unpacked
+    """
+    # the command code without the synthesizer selector gives the reply size
+    sizes = [reply_len[command & ~vs.SYNTH_B] for command in commands]
+    with self._lock:
+      self.conn.open()
+      try:
+        self.conn.write(struct.pack(">%dB" % len(commands), *commands))
+        reply = self.conn.read(sum(sizes)+len(sizes))
+      finally:
+        self.conn.close()
+    if len(reply) != sum(sizes)+len(sizes):
+      raise ObservatoryError(commands,"incomplete reply")
+    replies = {}
+    offset = 0
+    for command, size in zip(commands, sizes):
+      data = reply[offset:offset+size]
+      offset += size+1 # skip the checksum
+      if command & ~vs.SYNTH_B == REG_READ:
+        data = self._unpack_registers(data)
+      replies[command] = data
+    return replies
+
+  def _unpack_registers(self, data):
+    """
+    Fields of the six PLL registers, unpacked in one go
+
+    @param data : reply to a REG_READ command
+    @type  data : 24 bytes
+
+    @return: dict of fields
+    """
+    reg0, reg1, reg2, reg3, reg4, reg5 = struct.unpack(">IIIIII", data)
+    # valon_synth's own decoding of the frequency fields, so that e.g. the
+    # divider follows its table
+    ncount, frac, mod, dbf = self._unpack_freq_registers(data)
+    return {"ncount":   ncount,
+            "frac":     frac,
+            "mod":      mod,
+            "dbf":      dbf,
+            "low_spur": ((reg2 >> 30) & 1) & ((reg2 >> 29) & 1),
+            "double":   (reg2 >> 25) & 1,
+            "half":     (reg2 >> 24) & 1,
+            "r":        (reg2 >> 14) & 0x03ff,
+            "rfl":      (reg4 >> 3) & 0x03}
+
+  def _decode_frequency(self, s, replies):
+    """
+    Output frequency in MHz from the PLL registers and the reference
+    """
+    regs = replies[REG_READ | s]
+    EPDF = struct.unpack(">I", replies[REF_READ])[0]/1e6 \
+           * (1+regs["double"])/((1+regs["half"])*max(regs["r"],1))
+    return (regs["ncount"] + float(regs["frac"])/regs["mod"])*EPDF/regs["dbf"]
+
+  def _decode_rf_level(self, s, replies):
+    """
+    RF level in dBm from the PLL registers
+    """
+    return self.rfl_table.get(replies[REG_READ | s]["rfl"])
+
+  def _decode_options(self, s, replies):
+    """
+    (double, half, r, low_spur) from the PLL registers
+    """
+    regs = replies[REG_READ | s]
+    return regs["double"], regs["half"], regs["r"], regs["low_spur"]
+
+  def _decode_phase_lock(self, s, replies):
+    """
+    True if the synthesizer is phase locked
+    """
+    mask = 0x10 if s == vs.SYNTH_B else 0x20
+    return (struct.unpack(">B", replies[LOCK_READ | s])[0] & mask) > 0
+
+  def _decode_label(self, s, replies):
+    """
+    Synthesizer label
+    """
+    return replies[LABEL_READ | s]
+
+  def _decode_vco_range(self, s, replies):
+    """
+    (minimum, maximum) VCO frequency in MHz
+    """
+    return struct.unpack(">HH", replies[VCO_READ | s])
     
   def __unicode__(self):
     return "Valon5007"
@@ -197,6 +558,9 @@ class Valon5007(vs.Synthesizer):
     """
     Re-read the specified parameter
 
+    If the parameter was read less than self._ttl seconds ago the remembered
+    value is returned without querying the hardware.
+
     @param param : name of the parameter
     @type  param : str
 
@@ -207,10 +571,14 @@ class Valon5007(vs.Synthesizer):
     """
     s = synth[synth_id]
     module_logger.debug("get_p: (synthesizer %d %d): %s",synth_id,s,param)
-    module_logger.debug("get_p: task %s",str(self.__get_tasks__[param]))
-    self.status[synth_id][param] = self.__get_tasks__[param](s)
-    module_logger.debug("get_p: result: %s",self.status[synth_id][param])
-    return self.status[synth_id][param]
+    with self._lock:
+      if monotonic() - self._cache_ts.get((synth_id,param), float("-inf")) \
+                                                                 < self._ttl:
+        return self.status[synth_id][param]
+      module_logger.debug("get_p: task %s",self.__get_tasks__[param])
+      value = self.status[synth_id][param] = self.__get_tasks__[param](s)
+      self._cache_ts[(synth_id,param)] = monotonic()
+    return value
 
   def set_p(self, param, synth_id, *args, **kwargs):
     """
@@ -222,43 +590,424 @@ class Valon5007(vs.Synthesizer):
     @param synth_id : 1 or 2, as on datasheet
     @type  synth_id : int
 
+    If the requested value is the one already remembered nothing is sent.
+    Otherwise the whole status of the synthesizer is read back, since a set
+    can change other parameters too.
+
     @return: requested parameter
     """
-    module_logger.debug("Called set_p with %s, %s",str(args),str(kwargs))
+    if not self._write_p(param, synth_id, *args, **kwargs):
+      return self.status[synth_id][param]
+    if param in self.__settle_tasks__:
+      self.__settle_tasks__[param](synth[synth_id])
+    return self.update_synth_status(synth_id)[param]
+
+  def _unchanged(self, param, synth_id, args, kwargs):
+    """
+    True if the requested value is the remembered one
+
+    Only a value read less than self._ttl seconds ago counts, and a set with
+    arguments other than the value (e.g. chan_spacing) is never taken as
+    unchanged.
+
+    @param param : name of the parameter
+    @type  param : str
+
+    @param synth_id : 1 or 2, as on datasheet
+    @type  synth_id : int
+
+    @param args : positional arguments of the set method
+    @type  args : tuple
+
+    @param kwargs : keyword arguments of the set method
+    @type  kwargs : dict
+    """
+    if kwargs or monotonic() - self._cache_ts.get((synth_id,param),
+                                                  float("-inf")) >= self._ttl:
+      return False
+    current = self.status[synth_id].get(param)
+    if current is None:
+      return False
+    if param in tuple_params:
+      requested = tuple(args)
+      current = tuple(current)
+    elif len(args) == 1:
+      requested = args[0]
+    else:
+      # e.g. a frequency with the channel spacing given positionally
+      return False
+    if param == "label":
+      # the label is sent as at most 16 bytes and read back padded
+      requested, current = [v.encode() if isinstance(v, str) else bytes(v)
+                            for v in (requested, current)]
+      return requested[:16].rstrip(b" \0") == current.rstrip(b" \0")
+    if param in set_tolerance:
+      return abs(requested - current) <= set_tolerance[param]
+    return requested == current
+
+  def _wait_locked(self, s):
+    """
+    Wait until a synthesizer is phase locked
+
+    The lock is polled at intervals doubling from 1 ms, for no longer than
+    self._settle_max seconds.
+
+    @param s : vs.SYNTH_A or vs.SYNTH_B
+    @type  s : int
+
+    @return: True if locked
+    """
+    for dt in self._lock_polls():
+      if self._phase_locked(s):
+        return True
+      self._pause(dt)
+    if self._phase_locked(s):
+      return True
+    module_logger.warning("_wait_locked: synthesizer %d not locked", s)
+    return False
+
+  def _phase_locked(self, s):
+    """
+    Query the phase lock of a synthesizer
+
+    This uses the same command as the status read, rather than
+    valon_synth's get_phase_lock().
+
+    @param s : vs.SYNTH_A or vs.SYNTH_B
+    @type  s : int
+    """
+    return self._decode_phase_lock(s, self._exchange([LOCK_READ | s]))
+
+  def _lock_polls(self):
+    """
+    Waits between phase lock polls after a set
+
+    The waits double from 1 ms and stop self._settle_max seconds after the
+    first one is asked for.
+    """
+    deadline = monotonic() + self._settle_max
+    dt = 0.001
+    while True:
+      remaining = deadline - monotonic()
+      if remaining <= 0:
+        return
+      yield min(dt, remaining)
+      dt *= 2
+
+  def _pause(self, dt):
+    """
+    Wait 'dt' seconds, measured on the monotonic clock
+
+    sleep() is called again if it returns early, and the time spent is
+    counted from the call, not from each sleep().
+    """
+    target = monotonic() + dt
+    while True:
+      remaining = target - monotonic()
+      if remaining <= 0:
+        return
+      sleep(remaining)
+
+  def _write_p(self, param, synth_id, *args, **kwargs):
+    """
+    Send a parameter value to the synthesizer
+
+    This is the first half of set_p(), which must then wait for the
+    synthesizer to settle (see __settle_tasks__) before reading back the
+    parameter.
+
+    @param param : name of the parameter
+    @type  param : str
+
+    @param synth_id : 1 or 2, as on datasheet
+    @type  synth_id : int
+
+    @return: False if the value is the remembered one and was not sent
+    """
+    module_logger.debug("Called set_p with %s, %s",args,kwargs)
     s = synth[synth_id]
     if param == "rf_level":
       # This is a fix for the valon_synth.Synthesizer() method
       # which just returns False if you don't give a valid key.
       # This returns the nearest key.
-      pkeys = self.rfl_rev_table.keys()
-      pkeys.sort()
-      best_key = nearest_index(pkeys,args[0])
-      args = (pkeys[best_key],)
-    try:
-      success = self.__set_tasks__[param](s,*args,**kwargs)
-    except Exception, detail:
-      raise Exception(param,"set failed")
-    else:
-      sleep(0.1)
-      if success:
-        self.status[synth_id][param] = self.__get_tasks__[param](s)
-        return self.status[synth_id][param]
+      args = (nearest_in_sorted(self._rfl_keys, args[0]),)
+    with self._lock:
+      if self._unchanged(param, synth_id, args, kwargs):
+        module_logger.debug("set_p: %s of synth %d unchanged",
+                            param, synth_id)
+        return False
+      try:
+        success = self.__set_tasks__[param](s,*args,**kwargs)
+      except ObservatoryError:
+        raise
+      except Exception as detail:
+        raise ObservatoryError(param,"set failed") from detail
       else:
-        raise ObservatoryError(param,"setting failed")
+        if success:
+          self._forget(synth_id)
+          return True
+        else:
+          raise ObservatoryError(param,"setting failed")
+
+  def _forget(self, synth_id):
+    """
+    Expire all the remembered parameters of a synthesizer
+
+    A set can change parameters other than its own, e.g. the options change
+    the frequency and a re-lock changes the phase lock, so none of the
+    remembered values can be trusted after it and the next read of any of
+    them goes to the hardware.  The values are kept, so the status stays
+    complete if that read fails.
+
+    @param synth_id : 1 or 2, as on datasheet
+    @type  synth_id : int
+    """
+    for param in self._shown:
+      self._cache_ts.pop((synth_id,param), None)
+
+class ValonIOProcess(Process):
+  """
+  Process which owns the Valon5007 serial port
+
+  Requests are (tag, op, synth_id, param, args, kwargs) tuples taken from the
+  'requests' queue, where 'op' is "get", "set" or "update".  Each reply is put
+  on the 'replies' queue as (tag, ok, result) where 'result' is the returned
+  value if 'ok' and otherwise the repr() of the exception raised, which
+  unlike the exception itself can always be pickled.  A request None stops
+  the process; requests queued after it are answered with an error.  If the
+  synthesizer cannot be opened every request is answered with an error until
+  the process is stopped.
+
+  If several set requests for the same parameter are waiting only the newest
+  is sent to the hardware and all of them get its reply.
+  """
+  def __init__(self, requests, replies, timeout=None):
+    """
+    @param requests : queue from which requests are taken
+    @type  requests : multiprocessing.Queue
+
+    @param replies : queue on which replies are put
+    @type  replies : multiprocessing.Queue
+
+    @param timeout : serial port timeout
+    @type  timeout : float
+    """
+    Process.__init__(self)
+    self.daemon = True
+    self.requests = requests
+    self.replies = replies
+    self.timeout = timeout
+
+  def run(self):
+    # a forked process inherits the parent's Valon5007 objects, and maybe
+    # their locks held by other threads; it opens the port afresh
+    Valon5007._instances = {}
+    Valon5007._instances_lock = threading.RLock()
+    try:
+      hw = Valon5007(timeout=self.timeout)
+    except Exception as detail:
+      module_logger.error("ValonIOProcess: %r", detail)
+      failure = "cannot open synthesizer: " + repr(detail)
+      for request in iter(self.requests.get, None):
+        self.replies.put((request[0], False, failure))
+      return
+    while True:
+      batch = [self.requests.get()]
+      while True:
+        try:
+          batch.append(self.requests.get_nowait())
+        except queue.Empty:
+          break
+      stop = None in batch
+      if stop:
+        for request in batch[batch.index(None)+1:]:
+          if request is not None:
+            self.replies.put((request[0], False, "I/O process stopped"))
+        batch = batch[:batch.index(None)]
+      newest = {}
+      for request in batch:
+        if request and request[1] == "set":
+          newest[request[2:4]] = request[0]
+      superseded = {}
+      for request in batch:
+        tag, op, synth_id, param, args, kwargs = request
+        if op == "set" and newest[(synth_id,param)] != tag:
+          superseded.setdefault(newest[(synth_id,param)], []).append(tag)
+          continue
+        try:
+          if op == "get":
+            result = hw.get_p(param, synth_id)
+          elif op == "set":
+            result = hw.set_p(param, synth_id, *args, **kwargs)
+          else:
+            # a plain copy; pickling the status dict itself could read it
+            result = dict(hw.update_synth_status(synth_id))
+        except Exception as detail:
+          ok, result = False, repr(detail)
+        else:
+          ok = True
+        for t in [tag] + superseded.pop(tag, []):
+          self.replies.put((t, ok, result))
+      if stop:
+        return
+
+class ValonProxy(object):
+  """
+  Valon5007 interface which does its serial I/O in a ValonIOProcess
+
+  Threads calling the methods wait on a queue rather than on the serial port,
+  so they do not stall the other threads of the process.
+  """
+  def __init__(self, timeout=None):
+    """
+    Start the I/O process
+    """
+    self.requests = Queue()
+    self.replies = Queue()
+    self.io = ValonIOProcess(self.requests, self.replies, timeout=timeout)
+    self.io.start()
+    self._tags = itertools.count()
+    self._cond = threading.Condition()
+    self._reading = False
+    self._pending = {}
+    # seconds between checks that the I/O process is alive
+    self._poll = 0.1
+
+  def _call(self, op, synth_id, param=None, args=(), kwargs={}):
+    """
+    Send a request to the I/O process and wait for its reply
+
+    The reply queue is polled so that a thread stops waiting if the I/O
+    process has died.
+    """
+    with self._cond:
+      tag = next(self._tags)
+    self.requests.put((tag, op, synth_id, param, args, kwargs))
+    with self._cond:
+      # only one thread at a time reads the reply queue; it hands on the
+      # replies meant for the others
+      while tag not in self._pending:
+        if self._reading:
+          self._cond.wait()
+          continue
+        self._reading = True
+        self._cond.release()
+        try:
+          reply = self.replies.get(timeout=self._poll)
+        except queue.Empty:
+          reply = None
+        finally:
+          self._cond.acquire()
+          self._reading = False
+        self._cond.notify_all()
+        if reply is not None:
+          self._pending[reply[0]] = reply[1:]
+        elif not self.io.is_alive():
+          raise ObservatoryError(param, "I/O process not running")
+      ok, result = self._pending.pop(tag)
+    if ok:
+      return result
+    raise ObservatoryError(param, result)
+
+  def get_p(self, param, synth_id):
+    """
+    See Valon5007.get_p()
+    """
+    return self._call("get", synth_id, param)
+
+  def set_p(self, param, synth_id, *args, **kwargs):
+    """
+    See Valon5007.set_p()
+    """
+    return self._call("set", synth_id, param, args, kwargs)
+
+  def update_synth_status(self, synth_id):
+    """
+    See Valon5007.update_synth_status()
+    """
+    return self._call("update", synth_id)
+
+  def close(self):
+    """
+    Stop the I/O process
+    """
+    self.requests.put(None)
+    self.io.join()
+
+class AsyncValon5007(object):
+  """
+  asyncio interface to a Valon5007
+
+  The blocking serial I/O runs in the event loop's default executor, one
+  exchange at a time.  Between the phase lock polls after a set the serial
+  line is released, so other coroutines can use it meanwhile.
+  """
+  def __init__(self, timeout=None):
+    """
+    Initialize the Valon5007
+    """
+    self.hw = Valon5007(timeout=timeout)
+    self._lock = asyncio.Lock()
+
+  async def _run(self, method, *args, **kwargs):
+    """
+    Call a Valon5007 method in the executor while holding the serial line
+    """
+    async with self._lock:
+      loop = asyncio.get_running_loop()
+      return await loop.run_in_executor(
+                          None, functools.partial(method, *args, **kwargs))
+
+  async def get_p(self, param, synth_id):
+    """
+    See Valon5007.get_p()
+    """
+    return await self._run(self.hw.get_p, param, synth_id)
+
+  async def set_p(self, param, synth_id, *args, **kwargs):
+    """
+    See Valon5007.set_p()
+    """
+    if not await self._run(self.hw._write_p, param, synth_id, *args, **kwargs):
+      return self.hw.status[synth_id][param]
+    if param in self.hw.__settle_tasks__:
+      await self._wait_locked(synth[synth_id])
+    status = await self._run(self.hw.update_synth_status, synth_id)
+    return status[param]
+
+  async def _wait_locked(self, s):
+    """
+    See Valon5007._wait_locked()
+    """
+    for dt in self.hw._lock_polls():
+      if await self._run(self.hw._phase_locked, s):
+        return True
+      await asyncio.sleep(dt)
+    if await self._run(self.hw._phase_locked, s):
+      return True
+    module_logger.warning("_wait_locked: synthesizer %d not locked", s)
+    return False
+
+  async def update_synth_status(self, synth_id):
+    """
+    See Valon5007.update_synth_status()
+    """
+    return await self._run(self.hw.update_synth_status, synth_id)
 
 class Valon1(Synthesizer):
   """
   Each output of the Valon 5005 is treated as a logically separate
   synthesizer
   """
+  __slots__ = ("hw", "status")
   instance_exists = False
-  def __init__(self, timeout=None):
+  def __init__(self, timeout=None, port="/dev/ttyUSB0"):
     """
     Instantiate a synthesizer using Valon 5005 channel 1
 
     Any parameters pertaning to the hardware can be queried as self.hw.method()
     """
-    self.hw = Valon5007(timeout=timeout)
+    self.hw = Valon5007(timeout=timeout, port=port)
     self.status = self.hw.status[1]
     Valon1.instance_exists = True
 
@@ -307,14 +1056,15 @@ class Valon2(Synthesizer):
   Each output of the Valon 5005 is treated as a logically separate
   synthesizer
   """
+  __slots__ = ("hw", "status")
   instance_exists = False
-  def __init__(self,timeout=None):
+  def __init__(self,timeout=None, port="/dev/ttyUSB0"):
     """
     Instantiate a synthesizer using Valon 5005 channel 1
 
     Any parameters pertaining to the hardware can be queried as self.hw.method()
     """
-    self.hw = Valon5007(timeout=timeout)
+    self.hw = Valon5007(timeout=timeout, port=port)
     self.status = self.hw.status[2]
 
   def get_p(self,param):
@@ -361,17 +1111,17 @@ class Valon2(Synthesizer):
 
 if __name__ == "__main__":
   a = ClassInstance(Synthesizer,Valon1)
-  print "Synthesizer",a.__unicode__()
-  print a.get_p("label"), "frequency is", a.get_p("frequency"),"MHz"
-  print a.update_synth_status()
+  print("Synthesizer",a.__unicode__())
+  print(a.get_p("label"), "frequency is", a.get_p("frequency"),"MHz")
+  print(a.update_synth_status())
 
   b = ClassInstance(Synthesizer,Valon2)
-  print "Synthesizer",b.__unicode__()
-  print b.get_p("label"), "frequency is", b.get_p("frequency"),"MHz"
-  print b.update_synth_status()
+  print("Synthesizer",b.__unicode__())
+  print(b.get_p("label"), "frequency is", b.get_p("frequency"),"MHz")
+  print(b.update_synth_status())
 
   # This will raise an error
   try:
     d = ClassInstance(Synthesizer,Agilent)
-  except NameError, details:
-    print "Synthesizer NameError:",details
\ No newline at end of file
+  except NameError as details:
+    print("Synthesizer NameError:",details)
\ No newline at end of file
@@ -0,0 +1,47 @@
+"""
+Fixtures for the tests, which run against a stub serial port
+
+Packages which are not installed are replaced by the stand-ins in stubs.py.
+"""
+import importlib
+import importlib.util
+import os
+
+import pytest
+
+import stubs
+
+for name in ("valon_synth", "MonitorControl", "Electronics.Instruments"):
+  try:
+    importlib.import_module(name)
+  except ImportError:
+    stubs.install(name)
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope="session")
+def Valon():
+  """
+  The module under test
+  """
+  spec = importlib.util.spec_from_file_location(
+                                    "Valon", os.path.join(HERE, "__init__.py"))
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+@pytest.fixture
+def stub_serial(Valon, monkeypatch):
+  """
+  Make valon_synth open a StubSerial instead of a serial port
+  """
+  monkeypatch.setattr(Valon.vs.serial, "Serial", stubs.StubSerial)
+  yield
+  getattr(Valon.Valon5007, "_instances", {}).clear()
+
+@pytest.fixture
+def hw(Valon, stub_serial):
+  """
+  A Valon5007 on a StubSerial
+  """
+  return Valon.Valon5007(timeout=1)
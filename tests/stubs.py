@@ -0,0 +1,207 @@
+"""
+Stand-ins for the serial port and for the packages the module imports
+
+The packages are only replaced where they cannot be imported (see
+conftest.py).  The stand-in valon_synth talks to the port with the same read
+commands as the real one, but its set methods write straight into the stub's
+memory.
+"""
+import struct
+import sys
+import types
+from time import sleep
+
+SYNTH_A = 0x00
+SYNTH_B = 0x08
+
+# reply sizes of the Valon read commands, without the checksum byte
+SIZES = {0x80: 24, 0x81: 4, 0x82: 16, 0x83: 4, 0x86: 1}
+
+def registers(ncount, frac, mod, dbf, rfl, double, half, r, low_spur):
+  """
+  PLL register block with the given fields
+  """
+  reg0 = (ncount << 15) | (frac << 3)
+  reg1 = mod << 3
+  reg2 = (low_spur*3 << 29) | (double << 25) | (half << 24) | (r << 14)
+  reg4 = (dbf << 20) | (rfl << 3)
+  return struct.pack(">IIIIII", reg0, reg1, reg2, 3, reg4, 5)
+
+def fill(memory, fields, vco_range, lock, label=b"stub"):
+  """
+  Put the same contents for both synthesizers in a stub's memory
+  """
+  for s in (SYNTH_A, SYNTH_B):
+    memory[0x80 | s] = registers(*fields)
+    memory[0x82 | s] = label.ljust(16)
+    memory[0x83 | s] = struct.pack(">HH", *vco_range)
+    memory[0x86 | s] = struct.pack(">B", lock)
+  memory[0x81] = struct.pack(">I", 10000000)
+
+class StubSerial(object):
+  """
+  Answers Valon read commands from 'memory'
+
+  The replies are discarded on open().  Each write is recorded in
+  'commands', and takes 'delay' seconds.  Opening the port while it is open
+  fails, as it would for two users of a real port.
+  """
+  def __init__(self, *args, **kwargs):
+    self.memory = {}
+    fill(self.memory, (100, 3, 10, 1, 2, 0, 0, 1, 0), (2200, 4400), 0x30)
+    self.pending = b""
+    self.commands = []
+    self.delay = 0
+    self.timeout = None
+    self.is_open = False
+
+  def setPort(self, port):
+    self.port = port
+
+  def setTimeout(self, timeout):
+    self.timeout = timeout
+
+  def open(self):
+    if self.is_open:
+      raise IOError("port already open")
+    self.is_open = True
+    self.pending = b""
+
+  def close(self):
+    self.is_open = False
+
+  def write(self, data):
+    self.commands.append(bytes(data))
+    sleep(self.delay)
+    for command in bytearray(data):
+      reply = self.memory[command]
+      self.pending += reply + struct.pack(">B", sum(bytearray(reply)) % 256)
+
+  def read(self, size):
+    data, self.pending = self.pending[:size], self.pending[size:]
+    return data
+
+class Synthesizer(object):
+  """
+  Stand-in for valon_synth.Synthesizer
+  """
+  rfl_table = {0: -4, 1: -1, 2: 2, 3: 5}
+  rfl_rev_table = {-4: 0, -1: 1, 2: 2, 5: 3}
+  dbf_table = {0: 1, 1: 2, 2: 4, 3: 8, 4: 16}
+
+  def __init__(self, port):
+    self.conn = sys.modules["valon_synth"].serial.Serial()
+    self.conn.setPort(port)
+
+  def _read(self, command):
+    self.conn.open()
+    try:
+      self.conn.write(struct.pack(">B", command))
+      return self.conn.read(SIZES[command & ~SYNTH_B]+1)[:-1]
+    finally:
+      self.conn.close()
+
+  def _fields(self, synth):
+    reg0, reg1, reg2, reg3, reg4, reg5 = struct.unpack(">IIIIII",
+                                                   self._read(0x80 | synth))
+    return reg0, reg1, reg2, reg4
+
+  def _store(self, synth, reg0=None, reg1=None, reg2=None, reg4=None):
+    memory = self.conn.memory
+    regs = list(struct.unpack(">IIIIII", memory[0x80 | synth]))
+    for idx, value in ((0, reg0), (1, reg1), (2, reg2), (4, reg4)):
+      if value is not None:
+        regs[idx] = value
+    memory[0x80 | synth] = struct.pack(">IIIIII", *regs)
+    return True
+
+  def _unpack_freq_registers(self, data):
+    reg0, reg1, reg2, reg3, reg4, reg5 = struct.unpack(">IIIIII", data)
+    return ((reg0 >> 15) & 0xffff, (reg0 >> 3) & 0x0fff,
+            (reg1 >> 3) & 0x0fff, self.dbf_table.get((reg4 >> 20) & 0x07, 1))
+
+  def _epdf(self, synth):
+    ref = struct.unpack(">I", self._read(0x81))[0]/1e6
+    double, half, r, low_spur = self.get_options(synth)
+    return ref*(1+double)/((1+half)*max(r, 1))
+
+  def get_frequency(self, synth):
+    ncount, frac, mod, dbf = self._unpack_freq_registers(
+                                                  self._read(0x80 | synth))
+    return (ncount + float(frac)/mod)*self._epdf(synth)/dbf
+
+  def set_frequency(self, synth, freq, chan_spacing=10.):
+    ncount = int(round(freq/self._epdf(synth)))
+    return self._store(synth, reg0=ncount << 15, reg1=1 << 3, reg4=
+                       self._fields(synth)[3] & ~(0x07 << 20))
+
+  def get_rf_level(self, synth):
+    return self.rfl_table[(self._fields(synth)[3] >> 3) & 0x03]
+
+  def set_rf_level(self, synth, rf_level):
+    if rf_level not in self.rfl_rev_table:
+      return False
+    reg4 = self._fields(synth)[3] & ~(0x03 << 3)
+    return self._store(synth, reg4=reg4 | self.rfl_rev_table[rf_level] << 3)
+
+  def get_options(self, synth):
+    reg2 = self._fields(synth)[2]
+    return ((reg2 >> 25) & 1, (reg2 >> 24) & 1, (reg2 >> 14) & 0x03ff,
+            ((reg2 >> 30) & 1) & ((reg2 >> 29) & 1))
+
+  def set_options(self, synth, double=0, half=0, r=1, low_spur=0):
+    return self._store(synth, reg2=(low_spur*3 << 29) | (double << 25)
+                                   | (half << 24) | (r << 14))
+
+  def get_vco_range(self, synth):
+    return struct.unpack(">HH", self._read(0x83 | synth))
+
+  def set_vco_range(self, synth, low, high):
+    self.conn.memory[0x83 | synth] = struct.pack(">HH", low, high)
+    return True
+
+  def get_phase_lock(self, synth):
+    mask = 0x10 if synth == SYNTH_B else 0x20
+    return (struct.unpack(">B", self._read(0x86 | synth))[0] & mask) > 0
+
+  def get_label(self, synth):
+    return self._read(0x82 | synth)
+
+  def set_label(self, synth, label):
+    self.conn.memory[0x82 | synth] = struct.pack(">16s", label.encode())
+    return True
+
+class ObservatoryError(Exception):
+  """
+  Stand-in for MonitorControl.ObservatoryError
+  """
+
+def ClassInstance(template, cls, *args, **kwargs):
+  """
+  Stand-in for MonitorControl.ClassInstance
+  """
+  return cls(*args, **kwargs)
+
+def install(name):
+  """
+  Put the stand-in for package 'name' in sys.modules
+  """
+  if name == "valon_synth":
+    module = types.ModuleType(name)
+    module.STAND_IN = True
+    module.SYNTH_A = SYNTH_A
+    module.SYNTH_B = SYNTH_B
+    module.Synthesizer = Synthesizer
+    module.serial = types.SimpleNamespace(Serial=StubSerial)
+  elif name == "MonitorControl":
+    module = types.ModuleType(name)
+    module.ObservatoryError = ObservatoryError
+    module.ClassInstance = ClassInstance
+  elif name == "Electronics.Instruments":
+    sys.modules.setdefault("Electronics", types.ModuleType("Electronics"))
+    module = types.ModuleType(name)
+    module.Synthesizer = type("Synthesizer", (object,), {})
+    sys.modules["Electronics"].Instruments = module
+  else:
+    raise ValueError(name)
+  sys.modules[name] = module
@@ -0,0 +1,40 @@
+"""
+Check the batched status read against the valon_synth getters
+
+Both are run against a stub serial device which answers the Valon read
+commands from fixed register contents.  This needs the real valon_synth.
+"""
+import pytest
+
+from stubs import fill
+
+vs = pytest.importorskip("valon_synth")
+if getattr(vs, "STAND_IN", False):
+  pytest.skip("valon_synth is not installed", allow_module_level=True)
+
+SETUPS = [
+  # ncount, frac, mod, dbf, rfl, double, half, r, low_spur
+  ((100, 3, 10, 1, 2, 0, 0, 1, 0), (200, 201), 0x30),
+  ((320, 7, 20, 3, 0, 1, 0, 2, 1), (400, 4400), 0x20),
+  # a divider code past the end of valon_synth's table
+  ((150, 0, 1, 5, 3, 0, 1, 1, 0), (2200, 4400), 0x10)]
+
+@pytest.fixture(params=SETUPS)
+def setup(request, hw):
+  fill(hw.conn.memory, *request.param)
+  # forget what was read before the fill
+  hw._cache_ts.clear()
+  return hw
+
+def test_status_matches_getters(Valon, setup):
+  for synth_id, s in Valon.synth.items():
+    status = setup.update_synth_status(synth_id)
+    assert status["frequency"] == pytest.approx(setup.get_frequency(s))
+    assert status["rf_level"] == setup.get_rf_level(s)
+    assert tuple(status["options"]) == tuple(setup.get_options(s))
+    assert tuple(status["VCO range"]) == tuple(setup.get_vco_range(s))
+    assert status["phase lock"] == setup.get_phase_lock(s)
+
+def test_phase_lock_poll_matches_getter(Valon, setup):
+  for s in Valon.synth.values():
+    assert setup._phase_locked(s) == setup.get_phase_lock(s)
@@ -0,0 +1,293 @@
+"""
+Tests of the Valon5007 interface against a stub serial port
+"""
+import asyncio
+import queue
+import threading
+from time import monotonic, sleep
+
+import pytest
+
+def reads(hw):
+  """
+  Number of serial writes so far
+  """
+  return len(hw.conn.commands)
+
+def test_get_p_within_ttl_is_remembered(hw):
+  label = hw.get_p("label", 1)
+  before = reads(hw)
+  assert hw.get_p("label", 1) == label
+  assert reads(hw) == before
+
+def test_get_p_after_ttl_is_read(hw):
+  hw.get_p("label", 1)
+  before = reads(hw)
+  hw._ttl = 0
+  hw.get_p("label", 1)
+  assert reads(hw) > before
+
+def test_set_p_reads_back(hw):
+  assert hw.set_p("label", 1, "other").rstrip(b" \0") == b"other"
+
+def test_forget_expires_but_keeps_values(hw):
+  status = dict(hw.update_synth_status(1))
+  hw._forget(1)
+  assert not [key for key in hw._cache_ts if key[0] == 1]
+  assert dict(hw.status[1]) == status
+
+def test_failed_read_back_keeps_status(hw, monkeypatch):
+  params = set(hw.update_synth_status(1))
+  def broken(size):
+    raise IOError("no reply")
+  monkeypatch.setattr(hw.conn, "read", broken)
+  with pytest.raises(Exception):
+    hw.set_p("label", 1, "other")
+  assert set(hw.status[1]) == params
+
+def test_status_is_read_in_one_exchange(hw):
+  hw._cache_ts.clear()
+  before = reads(hw)
+  status = hw.update_synth_status(2)
+  assert reads(hw) == before+1
+  assert status["label"].rstrip(b" \0") == b"stub"
+
+def run_io(Valon, *requests):
+  """
+  Serve 'requests' with ValonIOProcess.run() in this process
+
+  @return: dict of (ok, result) by tag
+  """
+  inbox, outbox = queue.Queue(), queue.Queue()
+  for request in requests:
+    inbox.put(request)
+  # run() replaces the registry of Valon5007 objects, as a forked process
+  # must
+  registry = Valon.Valon5007._instances, Valon.Valon5007._instances_lock
+  try:
+    Valon.ValonIOProcess(inbox, outbox).run()
+  finally:
+    Valon.Valon5007._instances, Valon.Valon5007._instances_lock = registry
+  replies = {}
+  while not outbox.empty():
+    tag, ok, result = outbox.get()
+    replies[tag] = (ok, result)
+  return replies
+
+def test_io_process_coalesces_sets(Valon, stub_serial):
+  replies = run_io(Valon, (0, "set", 1, "label", ("first",), {}),
+                          (1, "set", 1, "label", ("second",), {}),
+                          (2, "get", 1, "label", (), {}),
+                          None,
+                          (3, "get", 1, "label", (), {}))
+  assert replies[0] == replies[1]
+  assert replies[1][1].rstrip(b" \0") == b"second"
+  assert replies[2][1].rstrip(b" \0") == b"second"
+  assert replies[3] == (False, "I/O process stopped")
+
+def test_io_process_reports_errors(Valon, stub_serial):
+  replies = run_io(Valon, (0, "get", 1, "no such parameter", (), {}), None)
+  ok, result = replies[0]
+  assert not ok and isinstance(result, str)
+
+def test_io_process_answers_when_the_port_fails(Valon, monkeypatch):
+  def fail(*args, **kwargs):
+    raise IOError("no such port")
+  monkeypatch.setattr(Valon.vs.serial, "Serial", fail)
+  replies = run_io(Valon, (0, "get", 1, "label", (), {}),
+                          (1, "update", 2, None, (), {}),
+                          None)
+  assert sorted(replies) == [0, 1]
+  for ok, result in replies.values():
+    assert not ok and result.startswith("cannot open synthesizer")
+
+def test_proxy(Valon, stub_serial):
+  proxy = Valon.ValonProxy()
+  try:
+    assert proxy.get_p("label", 1).rstrip(b" \0") == b"stub"
+    assert proxy.set_p("label", 2, "proxy").rstrip(b" \0") == b"proxy"
+  finally:
+    proxy.close()
+
+def test_proxy_stops_waiting_for_a_dead_process(Valon, monkeypatch):
+  monkeypatch.setattr(Valon.ValonIOProcess, "run", lambda self: None)
+  proxy = Valon.ValonProxy()
+  proxy.io.join()
+  with pytest.raises(Valon.ObservatoryError):
+    proxy.get_p("label", 1)
+
+def test_async(Valon, stub_serial):
+  async def use(valon):
+    label = await valon.set_p("label", 1, "async")
+    return label, await valon.get_p("label", 1)
+  label, again = asyncio.run(use(Valon.AsyncValon5007()))
+  assert label.rstrip(b" \0") == b"async"
+  assert again == label
+
+def test_set_p_takes_the_nearest_rf_level(hw):
+  assert hw.set_p("rf_level", 1, 3) == 2
+  assert hw.set_p("rf_level", 1, -100) == -4
+
+def test_lock_polls_double_until_settle_max(hw):
+  waits = []
+  start = monotonic()
+  for dt in hw._lock_polls():
+    waits.append(dt)
+    sleep(dt)
+  assert waits[:4] == [0.001, 0.002, 0.004, 0.008]
+  assert hw._settle_max <= monotonic()-start < hw._settle_max+0.05
+
+def test_wait_locked(Valon, hw):
+  s = Valon.synth[1]
+  hw.conn.memory[Valon.LOCK_READ | s] = b"\x00"
+  start = monotonic()
+  assert not hw._wait_locked(s)
+  assert monotonic()-start >= hw._settle_max
+  hw.conn.memory[Valon.LOCK_READ | s] = b"\x20"
+  before = reads(hw)
+  assert hw._wait_locked(s)
+  assert reads(hw) == before+1
+
+@pytest.fixture
+def fresh(hw):
+  """
+  hw with the status of synthesizer 1 just read
+  """
+  hw.update_synth_status(1)
+  return hw
+
+def test_unchanged_frequency_within_tolerance(fresh):
+  frequency = fresh.status[1]["frequency"]
+  assert fresh._unchanged("frequency", 1, (frequency+1e-7,), {})
+  assert not fresh._unchanged("frequency", 1, (frequency+1e-3,), {})
+
+def test_unchanged_needs_a_fresh_value(fresh):
+  frequency = fresh.status[1]["frequency"]
+  fresh._ttl = 0
+  assert not fresh._unchanged("frequency", 1, (frequency,), {})
+
+def test_unchanged_with_more_arguments(fresh):
+  frequency = fresh.status[1]["frequency"]
+  assert not fresh._unchanged("frequency", 1, (frequency, 5.0), {})
+  assert not fresh._unchanged("frequency", 1, (frequency,),
+                              {"chan_spacing": 5.0})
+
+def test_unchanged_tuples(fresh):
+  options = tuple(fresh.status[1]["options"])
+  vco_range = tuple(fresh.status[1]["VCO range"])
+  assert fresh._unchanged("options", 1, options, {})
+  assert not fresh._unchanged("options", 1, options[:2], {})
+  assert fresh._unchanged("VCO range", 1, vco_range, {})
+  assert not fresh._unchanged("VCO range", 1, vco_range[::-1], {})
+
+def test_unchanged_label(fresh):
+  assert fresh._unchanged("label", 1, ("stub",), {})
+  assert fresh._unchanged("label", 1, (b"stub",), {})
+  assert not fresh._unchanged("label", 1, ("stub2",), {})
+
+def test_set_p_of_the_same_value_sends_nothing(fresh):
+  frequency = fresh.status[1]["frequency"]
+  before = reads(fresh)
+  assert fresh.set_p("frequency", 1, frequency) == frequency
+  assert reads(fresh) == before
+
+def test_shown_parameters(hw):
+  assert list(hw.shown_parameters()) == sorted(hw.status[1])
+
+def test_one_object_per_port(Valon, stub_serial):
+  one, two = Valon.Valon1(port="stub"), Valon.Valon2(port="stub")
+  assert one.hw is two.hw
+  assert Valon.Valon1(port="other").hw is not one.hw
+
+def test_timeout_is_reapplied(Valon, stub_serial):
+  hw = Valon.Valon5007(timeout=1, port="stub")
+  assert Valon.Valon5007(port="stub").conn.timeout == 1
+  assert Valon.Valon5007(timeout=2, port="stub") is hw
+  assert hw.conn.timeout == 2
+
+def test_io_process_ignores_inherited_locks(Valon, stub_serial):
+  # a lock held by another thread, as a forked process would inherit it
+  held, done = threading.Event(), threading.Event()
+  def hold():
+    with Valon.Valon5007._instances_lock:
+      held.set()
+      done.wait()
+  holder = threading.Thread(target=hold)
+  holder.start()
+  held.wait()
+  replies = []
+  def serve():
+    replies.append(run_io(Valon, (0, "get", 1, "label", (), {}), None))
+  server = threading.Thread(target=serve)
+  server.daemon = True
+  server.start()
+  server.join(5)
+  done.set()
+  holder.join()
+  assert replies and replies[0][0][0]
+
+def test_threads_share_the_port(Valon, stub_serial):
+  one, two = Valon.Valon1(port="stub"), Valon.Valon2(port="stub")
+  one.hw._ttl = 0
+  one.hw.conn.delay = 0.001
+  errors = []
+  def poll(synthesizer):
+    try:
+      for n in range(20):
+        synthesizer.get_p("frequency")
+        synthesizer.update_synth_status()
+    except Exception as detail:
+      errors.append(detail)
+  threads = [threading.Thread(target=poll, args=(synthesizer,))
+             for synthesizer in (one, two)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert errors == []
+
+def test_construction_reads_nothing(hw):
+  assert reads(hw) == 0
+  assert hw.status[1]["label"].rstrip(b" \0") == b"stub"
+  assert reads(hw) == 1
+
+def test_concurrent_first_reads(Valon, stub_serial):
+  hw = Valon.Valon5007(port="stub")
+  hw.conn.delay = 0.05
+  results, errors = [], []
+  def read(synth_id):
+    try:
+      results.append(hw.status[synth_id]["frequency"])
+    except Exception as detail:
+      errors.append(detail)
+  threads = [threading.Thread(target=read, args=(synth_id,))
+             for synth_id in (1, 2, 1, 2)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert errors == []
+  assert len(results) == 4
+  assert reads(hw) == 1
+
+def test_pause_is_not_short(hw):
+  for dt in (0.001, 0.01, 0.02):
+    start = monotonic()
+    hw._pause(dt)
+    assert monotonic()-start >= dt
+
+def test_nearest_in_sorted(Valon):
+  keys = (-4, -1, 2, 5)
+  assert Valon.nearest_in_sorted(keys, -10) == -4
+  assert Valon.nearest_in_sorted(keys, 10) == 5
+  assert Valon.nearest_in_sorted(keys, 2) == 2
+  assert Valon.nearest_in_sorted(keys, 1) == 2
+  # ties go to the smaller key
+  assert Valon.nearest_in_sorted(keys, 0.5) == -1
+  assert Valon.nearest_in_sorted(keys, 3.5) == 2
+
+def test_both_synthesizers_are_read_in_one_exchange(hw):
+  hw.update_all_status()
+  assert reads(hw) == 1
+  # the reference is read once for both
+  assert len(hw.conn.commands[0]) == 9